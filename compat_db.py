@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+#Per-title compatibility flags. The flag -> appid lists are kept in
+#compat_db.json (plus an optional user_compat_db.json layered on top) and
+#compiled into an appid -> flag bitmask index. The compiled index is cached
+#next to the sources in a marshal file, keyed by the size and mtime of every
+#source, so a launch only has to stat the sources and load one small file.
+#
+#Source format:
+#  {
+#      "version": 1,
+#      "flags": { "<flag>": { "description": "...", "appids": { "<appid>": "<title>" } } },
+#      "unset": { "<flag>": { "appids": { "<appid>": "<title>" } } }
+#  }
+#"unset" is only meaningful in override files, it removes a flag from titles
+#that the files before it enabled it for.
+#Options that take a value carry it in the flag name, e.g. "cputopology:pcores+nosmt".
+
+import json
+import marshal
+import os
+
+DB_VERSION = 1
+
+DEFAULT_DB_NAME = "compat_db.json"
+USER_DB_NAME = "user_compat_db.json"
+COMPILED_DB_NAME = "compat_db.bin"
+
+def usage():
+    print("Usage:")
+    print("\t" + sys.argv[0] + "\tcompile\t<output file>\t<source file>...")
+    print("\t\tCompile the given source files, later ones overriding earlier ones.")
+    print("")
+    print("\t" + sys.argv[0] + "\tlookup\t<appid>\t<source file>...")
+    print("\t\tPrint the flags enabled for the given appid.")
+
+def source_signature(paths):
+    sig = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        sig.append((path, st.st_size, st.st_mtime_ns))
+    return sig
+
+def load_source(path):
+    with open(path, "r") as f:
+        db = json.load(f)
+    if db.get("version", DB_VERSION) > DB_VERSION:
+        raise ValueError(path + ": unsupported compat db version " + str(db["version"]))
+    return db
+
+def compile_sources(paths):
+    #merge the sources into { flag: set(appids) }
+    flag_appids = {}
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        db = load_source(path)
+        for flag, entry in db.get("flags", {}).items():
+            flag_appids.setdefault(flag, set()).update(entry.get("appids", {}))
+        for flag, entry in db.get("unset", {}).items():
+            flag_appids.get(flag, set()).difference_update(entry.get("appids", {}))
+
+    flags = sorted(flag_appids)
+    index = {}
+    for bit, flag in enumerate(flags):
+        for appid in flag_appids[flag]:
+            index[appid] = index.get(appid, 0) | (1 << bit)
+
+    return { "version": DB_VERSION, "flags": flags, "index": index }
+
+def load_compiled(path, sig):
+    try:
+        with open(path, "rb") as f:
+            compiled = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(compiled, dict) or \
+            compiled.get("version") != DB_VERSION or \
+            compiled.get("sources") != sig:
+        return None
+    return compiled
+
+def store_compiled(path, compiled):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        marshal.dump(compiled, f)
+    os.replace(tmp, path)
+
+def load(paths, compiled_path):
+    #returns the compiled index, rebuilding the cached copy if any source changed.
+    #callers that share compiled_path between processes should hold a lock.
+    sig = source_signature(paths)
+    compiled = load_compiled(compiled_path, sig)
+    if compiled is None:
+        compiled = compile_sources(paths)
+        compiled["sources"] = sig
+        try:
+            store_compiled(compiled_path, compiled)
+        except OSError:
+            #read-only install, just use the in-memory copy
+            pass
+    return compiled
+
+def lookup(compiled, appid):
+    mask = compiled["index"].get(appid, 0)
+    ret = set()
+    bit = 0
+    while mask:
+        if mask & 1:
+            ret.add(compiled["flags"][bit])
+        mask >>= 1
+        bit += 1
+    return ret
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) < 4:
+        usage()
+        sys.exit(1)
+
+    verb = sys.argv[1]
+
+    if verb == "compile":
+        compiled = compile_sources(sys.argv[3:])
+        compiled["sources"] = source_signature(sys.argv[3:])
+        store_compiled(sys.argv[2], compiled)
+        sys.exit(0)
+
+    if verb == "lookup":
+        for flag in sorted(lookup(compile_sources(sys.argv[3:]), sys.argv[2])):
+            print(flag)
+        sys.exit(0)
+
+    usage()
+    sys.exit(1)
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+
+#Reader and writer for the Fossilize StreamArchive databases written by
+#media-converter (see media-converter/src/fossilize.rs for the format). The
+#archives are memory mapped, so even multi-GB dumps can be indexed and copied
+#without reading them into memory.
+#
+#File layout, all integers little-endian:
+#  magic "\x81FOSSILIZEDB", uint32 version (5 or 6)
+#  then any number of entries:
+#    char[40] name: 8 hex digit tag followed by the 32 hex digit hash
+#    uint32 stored_size, uint32 flags, uint32 crc32, uint32 payload_size
+#    uint8[stored_size] payload
+
+import collections
+import fcntl
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+
+MAGIC = b"\x81FOSSILIZEDB"
+VERSION = 6
+MIN_COMPAT_VERSION = 5
+
+HEADER_LEN = len(MAGIC) + 4
+NAME_LEN = 40
+TAG_LEN = 8
+PAYLOAD_HEADER = struct.Struct("<IIII")
+ENTRY_HEADER_LEN = NAME_LEN + PAYLOAD_HEADER.size
+
+FLAG_COMPRESSION_NONE = 0x1
+FLAG_COMPRESSION_DEFLATE = 0x2
+
+#stored_size of an entry whose write never finished
+UNFINISHED_SIZE = 0xffffffff
+
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+#media-converter appends "<name> <unix time>" lines to <archive>.access when
+#it first reads an entry of a transcoded archive in a session
+ACCESS_LOG_SUFFIX = ".access"
+
+#tags used by media-converter, from audioconv/imp.rs and videoconv/imp.rs
+TAG_NAMES = {
+    "audio": ["stream", "codecinfo", "audiodata", "ptnadata"],
+    "video": ["videodata", "ogvdata", "stream", "mkvdata"],
+}
+
+Entry = collections.namedtuple("Entry", ["tag", "hash", "offset", "stored_size", "flags", "crc", "payload_size"])
+
+def usage():
+    print("Usage:")
+    print("\t" + sys.argv[0] + "\tlist\t<archive>")
+    print("\t\tList the entries of the archive and a per-tag summary.")
+    print("")
+    print("\t" + sys.argv[0] + "\tverify\t<archive>...")
+    print("\t\tCheck the CRC of every entry.")
+    print("")
+    print("\t" + sys.argv[0] + "\tmerge\t<output archive>\t<archive>...")
+    print("\t\tWrite every distinct entry of the given archives to the output archive.")
+    print("")
+    print("\t" + sys.argv[0] + "\tcompact\t<archive>...")
+    print("\t\tRewrite the archives without duplicate, corrupt or unfinished entries.")
+    print("")
+    print("\t" + sys.argv[0] + "\tevict\t<budget in bytes>\t<archive>...")
+    print("\t\tDrop the least recently used entries until each archive fits in the budget.")
+
+def open_archive(path):
+    '''Map the archive at path. Returns None for an empty file, raises
+    ValueError if it isn't a StreamArchive'''
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(buf) < HEADER_LEN or buf[0:len(MAGIC)] != MAGIC or \
+            not MIN_COMPAT_VERSION <= buf[HEADER_LEN - 1] <= VERSION:
+        buf.close()
+        raise ValueError(path + ": not a fossilize database")
+    return buf
+
+def iter_entries(buf):
+    '''Yield an Entry for every complete entry of a mapped archive. A
+    truncated or unfinished entry at the end is not returned'''
+    if buf is None:
+        return
+    pos = HEADER_LEN
+    size = len(buf)
+    while pos + ENTRY_HEADER_LEN <= size:
+        name = buf[pos:pos + NAME_LEN]
+        try:
+            tag = int(name[0:TAG_LEN], 16)
+            hash_ = name[TAG_LEN:].decode("ascii").lower()
+            int(hash_, 16)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("corrupt entry name at offset " + str(pos))
+        stored_size, flags, crc, payload_size = PAYLOAD_HEADER.unpack_from(buf, pos + NAME_LEN)
+        offset = pos + ENTRY_HEADER_LEN
+        if stored_size == UNFINISHED_SIZE or offset + stored_size > size:
+            return
+        yield Entry(tag, hash_, offset, stored_size, flags, crc, payload_size)
+        pos = offset + stored_size
+
+def payload(buf, entry):
+    return memoryview(buf)[entry.offset:entry.offset + entry.stored_size]
+
+def check_crc(buf, entry):
+    '''Whether the stored payload matches its CRC. Entries written without
+    a CRC have 0 there and always pass'''
+    if entry.crc == 0:
+        return True
+    crc = 0
+    with payload(buf, entry) as data:
+        for pos in range(0, len(data), COPY_CHUNK_SIZE):
+            crc = zlib.crc32(data[pos:pos + COPY_CHUNK_SIZE], crc)
+    return crc == entry.crc
+
+def tag_name(kind, tag):
+    names = TAG_NAMES.get(kind, [])
+    if tag < len(names):
+        return names[tag]
+    return str(tag)
+
+def archive_kind(path):
+    '''Guess which media-converter element an archive belongs to from its name'''
+    name = os.path.basename(path)
+    for kind in TAG_NAMES:
+        if kind in name:
+            return kind
+    return None
+
+def write_entry(out, buf, entry):
+    out.write("{:08x}".format(entry.tag).encode("ascii") + entry.hash.encode("ascii"))
+    out.write(PAYLOAD_HEADER.pack(entry.stored_size, entry.flags, entry.crc, entry.payload_size))
+    with payload(buf, entry) as data:
+        for pos in range(0, len(data), COPY_CHUNK_SIZE):
+            out.write(data[pos:pos + COPY_CHUNK_SIZE])
+
+def write_archive(path, sources):
+    '''Write the entries yielded by sources, an iterable of (buf, entry), to a
+    new archive that atomically replaces path. Returns the size written'''
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as out:
+        out.write(MAGIC + bytes([0, 0, 0, VERSION]))
+        for buf, entry in sources:
+            write_entry(out, buf, entry)
+        out.flush()
+        os.fsync(out.fileno())
+        size = out.tell()
+    os.replace(tmp, path)
+    return size
+
+def distinct_entries(bufs, verify=True):
+    '''Yield (buf, entry) for the first copy of each (tag, hash) in the given
+    archives, like media-converter which never writes an entry it already has.
+    With verify, copies that fail their CRC are passed over'''
+    seen = set()
+    for buf in bufs:
+        for entry in iter_entries(buf):
+            key = (entry.tag, entry.hash)
+            if key in seen:
+                continue
+            if verify and not check_crc(buf, entry):
+                continue
+            seen.add(key)
+            yield (buf, entry)
+
+def list_verb(path):
+    kind = archive_kind(path)
+    buf = open_archive(path)
+    try:
+        totals = {}
+        end = HEADER_LEN if buf is not None else 0
+        for entry in iter_entries(buf):
+            print(tag_name(kind, entry.tag) + "\t" + entry.hash + "\t" + str(entry.stored_size) +
+                    "\t" + str(entry.payload_size) + "\t" + hex(entry.flags) + "\t" + "{:08x}".format(entry.crc))
+            count, size = totals.get(entry.tag, (0, 0))
+            totals[entry.tag] = (count + 1, size + entry.stored_size)
+            end = entry.offset + entry.stored_size
+        for tag in sorted(totals):
+            print("# " + tag_name(kind, tag) + ": " + str(totals[tag][0]) + " entries, " + str(totals[tag][1]) + " bytes")
+        if buf is not None and end < len(buf):
+            print("# " + str(len(buf) - end) + " bytes of truncated data at the end")
+    finally:
+        if buf is not None:
+            buf.close()
+
+def verify_verb(path):
+    '''Returns the number of problems found'''
+    kind = archive_kind(path)
+    buf = open_archive(path)
+    problems = 0
+    try:
+        end = HEADER_LEN if buf is not None else 0
+        for entry in iter_entries(buf):
+            if not check_crc(buf, entry):
+                print(path + ": " + tag_name(kind, entry.tag) + " " + entry.hash + ": CRC mismatch")
+                problems += 1
+            end = entry.offset + entry.stored_size
+        if buf is not None and end < len(buf):
+            print(path + ": truncated entry at offset " + str(end))
+            problems += 1
+    finally:
+        if buf is not None:
+            buf.close()
+    return problems
+
+def merge_verb(dst, srcs):
+    bufs = [open_archive(src) for src in srcs]
+    try:
+        return write_archive(dst, distinct_entries(bufs))
+    finally:
+        for buf in bufs:
+            if buf is not None:
+                buf.close()
+
+def compact_verb(path):
+    '''Returns (old size, new size)'''
+    buf = open_archive(path)
+    if buf is None:
+        return (0, 0)
+    try:
+        old_size = len(buf)
+        return (old_size, write_archive(path, distinct_entries([buf])))
+    finally:
+        buf.close()
+
+def parse_access_log(f, access):
+    '''Add the access times read from f to access, keeping the latest'''
+    for line in f:
+        fields = line.split()
+        if len(fields) != 2 or len(fields[0]) != NAME_LEN:
+            continue
+        try:
+            key = (int(fields[0][0:TAG_LEN], 16), fields[0][TAG_LEN:].lower())
+            when = int(fields[1])
+        except ValueError:
+            continue
+        if when > access.get(key, -1):
+            access[key] = when
+    return access
+
+def load_access_log(path):
+    '''Read the access log media-converter appends to next to a transcoded
+    archive. Returns { (tag, hash): last access time }'''
+    try:
+        with open(path, "r") as f:
+            return parse_access_log(f, {})
+    except FileNotFoundError:
+        return {}
+
+def write_access_log(path, access, dropped=()):
+    '''Rewrite the access log with the times in access, plus whatever was
+    appended since it was read, minus the entries in dropped.
+
+    Running games keep the log open with O_APPEND, so it is truncated and
+    refilled in place rather than replaced, which would leave them appending
+    to an unlinked file. Our write appends as well, so a line written in
+    between ends up before ours instead of being overwritten.'''
+    fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT | os.O_CLOEXEC, 0o644)
+    try:
+        #keeps concurrent evicts apart, media-converter doesn't lock
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+
+        with open(fd, "r", closefd=False) as f:
+            current = parse_access_log(f, {})
+        access = dict(access)
+        for key, when in current.items():
+            if key not in dropped and when > access.get(key, -1):
+                access[key] = when
+
+        data = "".join("{:08x}".format(tag) + hash_ + " " + str(when) + "\n"
+                for (tag, hash_), when in access.items()).encode("ascii")
+        os.ftruncate(fd, 0)
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+def evict(path, budget, now=None):
+    '''Drop the least recently used entries of the archive at path until it
+    fits in budget bytes, in one streaming rewrite that atomically replaces
+    it. Entries that were never seen in the access log count as used now, so
+    new downloads survive until they had a chance to be played. The access
+    log is rewritten to cover the remaining entries.
+    Returns (old size, new size, number of entries evicted)'''
+    if now is None:
+        now = int(time.time())
+    log_path = path + ACCESS_LOG_SUFFIX
+
+    buf = open_archive(path)
+    if buf is None:
+        return (0, 0, 0)
+    try:
+        access = load_access_log(log_path)
+        entries = [entry for _, entry in distinct_entries([buf], verify=False)]
+
+        size = HEADER_LEN
+        for entry in entries:
+            access.setdefault((entry.tag, entry.hash), now)
+            size += ENTRY_HEADER_LEN + entry.stored_size
+
+        evicted = set()
+        for entry in sorted(entries, key=lambda e: access[(e.tag, e.hash)]):
+            if size <= budget:
+                break
+            evicted.add((entry.tag, entry.hash))
+            size -= ENTRY_HEADER_LEN + entry.stored_size
+
+        kept = [entry for entry in entries if (entry.tag, entry.hash) not in evicted]
+        old_size = len(buf)
+        if size != old_size:
+            size = write_archive(path, ((buf, entry) for entry in kept))
+    finally:
+        buf.close()
+
+    write_access_log(log_path, { (e.tag, e.hash): access[(e.tag, e.hash)] for e in kept }, evicted)
+    return (old_size, size, len(evicted))
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        usage()
+        sys.exit(1)
+
+    verb = sys.argv[1]
+
+    try:
+        if verb == "list":
+            list_verb(sys.argv[2])
+            sys.exit(0)
+
+        if verb == "verify":
+            problems = 0
+            for path in sys.argv[2:]:
+                problems += verify_verb(path)
+            sys.exit(1 if problems else 0)
+
+        if verb == "merge" and len(sys.argv) >= 4:
+            merge_verb(sys.argv[2], sys.argv[3:])
+            sys.exit(0)
+
+        if verb == "compact":
+            for path in sys.argv[2:]:
+                old_size, new_size = compact_verb(path)
+                print(path + ": " + str(old_size) + " -> " + str(new_size) + " bytes")
+            sys.exit(0)
+        if verb == "evict" and len(sys.argv) >= 4:
+            for path in sys.argv[3:]:
+                old_size, new_size, evicted = evict(path, int(sys.argv[2]))
+                print(path + ": " + str(old_size) + " -> " + str(new_size) + " bytes, " + str(evicted) + " entries evicted")
+            sys.exit(0)
+    except (OSError, ValueError) as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+
+    usage()
+    sys.exit(1)
@@ -50,6 +50,8 @@ use std::io::Seek;
 use std::fs::OpenOptions;
 use std::convert::From;
 use std::collections::HashMap;
+use std::collections::HashSet;
+use std::path::PathBuf;
 
 use crate::*;
 
@@ -201,6 +203,11 @@ pub struct StreamArchive {
     seen_blobs: Vec<HashMap<FossilizeHash, PayloadEntry>>,
 
     write_pos: u64,
+
+    /* read-only archives log the entries they read, see record_access() */
+    access_log_path: Option<PathBuf>,
+    access_log: Option<fs::File>,
+    accessed: HashSet<(FossilizeTag, FossilizeHash)>,
 }
 
 pub enum CRCCheck {
@@ -212,7 +219,15 @@ impl StreamArchive {
 
     pub fn new<P: AsRef<std::path::Path>>(filename: P, fileopts: &OpenOptions, read_only: bool, num_tags: usize) -> Result<Self, Error> {
 
-        let file = fileopts.open(filename)?;
+        let file = fileopts.open(&filename)?;
+
+        let access_log_path = if read_only {
+            let mut p = filename.as_ref().as_os_str().to_owned();
+            p.push(".access");
+            Some(PathBuf::from(p))
+        } else {
+            None
+        };
 
         let mut seen_blobs = Vec::new();
         for _ in 0..num_tags {
@@ -224,6 +239,9 @@ impl StreamArchive {
             read_only,
             seen_blobs,
             write_pos: 0,
+            access_log_path,
+            access_log: None,
+            accessed: HashSet::new(),
         };
 
         ret.prepare()?;
@@ -350,9 +368,49 @@ impl StreamArchive {
             }
         }
 
+        self.record_access(tag, hash);
+
         Ok(to_copy)
     }
 
+    /* appends "<name> <unix time>" to <archive>.access the first time an entry is read in this
+     * session. Proton uses it to evict the least recently used entries of transcoded archives. */
+    fn record_access(&mut self, tag: FossilizeTag, hash: FossilizeHash) {
+        let path = match &self.access_log_path {
+            None => { return; }
+            Some(p) => p.clone(),
+        };
+
+        if !self.accessed.insert((tag, hash)) {
+            return;
+        }
+
+        if self.access_log.is_none() {
+            match OpenOptions::new().append(true).create(true).open(path) {
+                Ok(f) => self.access_log = Some(f),
+                Err(_) => {
+                    /* read-only location, don't try again */
+                    self.access_log_path = None;
+                    return;
+                },
+            }
+        }
+
+        let now = std::time::SystemTime::now()
+            .duration_since(std::time::UNIX_EPOCH)
+            .map(|d| d.as_secs())
+            .unwrap_or(0);
+
+        let mut line = tag.to_ascii_bytes();
+        line.extend_from_slice(&hash.to_ascii_bytes());
+        line.extend_from_slice(format!(" {}\n", now).as_bytes());
+
+        /* a single O_APPEND write, so concurrent sessions don't interleave */
+        if let Some(f) = &mut self.access_log {
+            let _ = f.write_all(&line);
+        }
+    }
+
     pub fn write_entry(&mut self, tag: FossilizeTag, hash: FossilizeHash, data: &mut dyn Read, crc_opt: CRCCheck) -> Result<(), Error> {
         if self.has_entry(tag, hash) {
             return Ok(());
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+#Times every copy strategy of proton's copyfd() (reflink, copy_file_range,
+#sendfile, buffered) and the automatic pick, for copies within and between
+#filesystems.
+#
+#Run as root without arguments to test on a tmpfs and on ext4, btrfs and xfs
+#loop images, where the kernel and mkfs tools support them. Otherwise pass
+#directories on the filesystems to compare. Page cache is warm, so this shows
+#the cost of each mechanism rather than of the disk.
+#
+#Usage: tests/bench_copy_strategies.py [path to proton] [dir...]
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from proton_loader import load_proton
+
+LOOP_FILESYSTEMS = ["ext4", "btrfs", "xfs"]
+IMAGE_SIZE = 1024 * 1024 * 1024
+
+#a few big dlls and many small files, like a wine prefix
+FILES = [("big%d.dll" % i, 8 * 1024 * 1024) for i in range(16)] + \
+        [("small%d.dll" % i, 16 * 1024) for i in range(500)]
+
+def mount_filesystems(tmp):
+    '''Mount a tmpfs and one loop image per supported filesystem under tmp.
+    Returns [(name, mountpoint)]'''
+    with open("/proc/filesystems", "r") as f:
+        supported = set(line.split()[-1] for line in f if line.strip())
+
+    ret = []
+    mnt = os.path.join(tmp, "tmpfs")
+    os.mkdir(mnt)
+    if subprocess.call(["mount", "-t", "tmpfs", "-o", "size=1g", "tmpfs", mnt]) == 0:
+        ret.append(("tmpfs", mnt))
+    else:
+        print("tmpfs: mount failed, skipped")
+
+    for fs in LOOP_FILESYSTEMS:
+        if fs not in supported:
+            print(fs + ": not supported by this kernel, skipped")
+            continue
+        if shutil.which("mkfs." + fs) is None:
+            print(fs + ": mkfs." + fs + " not installed, skipped")
+            continue
+        image = os.path.join(tmp, fs + ".img")
+        with open(image, "wb") as f:
+            f.truncate(IMAGE_SIZE)
+        mnt = os.path.join(tmp, fs)
+        os.mkdir(mnt)
+        if subprocess.call(["mkfs." + fs, "-q", image], stdout=subprocess.DEVNULL) != 0 or \
+                subprocess.call(["mount", "-o", "loop", image, mnt]) != 0:
+            print(fs + ": couldn't create the loop image, skipped")
+            continue
+        ret.append((fs, mnt))
+    return ret
+
+def make_files(path):
+    os.makedirs(path)
+    for (name, size) in FILES:
+        with open(os.path.join(path, name), "wb") as f:
+            f.write(os.urandom(size))
+
+def copy_tree(proton, strategy, src, dst):
+    '''Copy the test files from src to dst with one strategy, or with
+    copyfd()'s own pick if strategy is None. Returns False if the strategy
+    doesn't work between the two'''
+    os.makedirs(dst)
+    for (name, size) in FILES:
+        with open(os.path.join(src, name), "rb", buffering=0) as fin, \
+                open(os.path.join(dst, name), "wb", buffering=0) as fout:
+            if strategy is None:
+                proton.copyfd(fin.fileno(), fout.fileno(), size)
+            elif not proton.copy_with(strategy, fin.fileno(), fout.fileno(), size):
+                return False
+    return True
+
+def main():
+    args = sys.argv[1:]
+    proton = load_proton(args.pop(0) if args and os.path.isfile(args[0]) else None)
+
+    tmp = tempfile.mkdtemp()
+    mounts = []
+    try:
+        if args:
+            targets = []
+            for d in args:
+                fd = os.open(d, os.O_RDONLY | os.O_DIRECTORY)
+                targets.append((proton.fs_type(fd) + ":" + d, d))
+                os.close(fd)
+        elif os.getuid() == 0:
+            targets = mount_filesystems(tmp)
+            mounts = [mnt for (name, mnt) in targets]
+        else:
+            print("not root, pass directories to compare")
+            return 1
+
+        work = []
+        for (name, d) in targets:
+            w = tempfile.mkdtemp(dir=d)
+            work.append((name, w))
+            make_files(os.path.join(w, "src"))
+
+        total = sum(size for (name, size) in FILES)
+        print("%d files, %s per copy" % (len(FILES), proton.format_size(total)))
+        print("%-24s %12s %12s %12s %12s  %s" % ("src -> dst", *proton.COPY_STRATEGIES, "auto"))
+        run = 0
+        for (src_name, src_work) in work:
+            for (dst_name, dst_work) in work:
+                cols = []
+                for strategy in proton.COPY_STRATEGIES + [None]:
+                    run += 1
+                    dst = os.path.join(dst_work, "dst%d" % run)
+                    proton.g_copy_strategies.clear()
+                    start = time.perf_counter()
+                    ok = copy_tree(proton, strategy, os.path.join(src_work, "src"), dst)
+                    elapsed = time.perf_counter() - start
+                    if strategy is None:
+                        picked = list(proton.g_copy_strategies.values())
+                        cols.append("%.3fs %s" % (elapsed, picked[0] if picked else "?"))
+                    else:
+                        cols.append("%.3fs" % elapsed if ok else "n/a")
+                    shutil.rmtree(dst)
+                print("%-24s %12s %12s %12s %12s  %s" % (src_name + " -> " + dst_name, *cols))
+
+        for (name, w) in work:
+            shutil.rmtree(w)
+    finally:
+        for mnt in mounts:
+            subprocess.call(["umount", mnt])
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    sys.exit(main())
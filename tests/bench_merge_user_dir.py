@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+#Times merge_user_dir() against the walker it replaced on a synthetic user
+#directory of about 100k files, and checks that both leave the same tree.
+#
+#Most of the files sit under save directories that already exist in the
+#destination, like a big legacy "Application Data" with cached mods and
+#replays, so they have to be skipped, and the rest is copied.
+#
+#The old walker is run with its "extant_dirs += dst_dir" fixed to append the
+#path. As shipped it added single characters, which matched nearly every
+#later directory and skipped far too much, so its output can't be compared.
+#
+#Run as root to also time it with a cold page cache, which is where walking
+#the skipped subtrees hurts most.
+#
+#Usage: tests/bench_merge_user_dir.py [path to proton]
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from proton_loader import load_proton
+
+#(top level dir, games, subdirs per game, files per subdir, exists in dst).
+#Only the top of dst is merged into, so existing dirs are at the top level
+LAYOUT = [
+    ("Application Data", 20, 30, 130, True),
+    ("Saved Games", 10, 20, 50, True),
+    ("Documents", 20, 20, 25, False),
+    ("Local Settings", 5, 10, 40, False),
+]
+
+def baseline_merge_user_dir(proton, src, dst):
+    '''merge_user_dir before the subtree pruning, with the extant_dirs fix'''
+    extant_dirs = []
+    for src_dir, dirs, files in os.walk(src):
+        dst_dir = src_dir.replace(src, dst, 1)
+
+        #as described below, avoid merging game save subdirs, too
+        child_of_extant_dir = False
+        for dir_ in extant_dirs:
+            if dir_ in dst_dir:
+                child_of_extant_dir = True
+                break
+        if child_of_extant_dir:
+            continue
+
+        #we only want to copy into directories which don't already exist. games
+        #may not react well to two save directory instances being merged.
+        if not proton.file_exists(dst_dir, follow_symlinks=True) or os.path.samefile(dst_dir, dst):
+            proton.makedirs(dst_dir)
+            for dir_ in dirs:
+                src_file = os.path.join(src_dir, dir_)
+                dst_file = os.path.join(dst_dir, dir_)
+                if os.path.islink(src_file) and not proton.file_exists(dst_file, follow_symlinks=True):
+                    proton.try_copy(src_file, dst_file, copy_metadata=True, follow_symlinks=False)
+            for file_ in files:
+                src_file = os.path.join(src_dir, file_)
+                dst_file = os.path.join(dst_dir, file_)
+                if not proton.file_exists(dst_file, follow_symlinks=True):
+                    proton.try_copy(src_file, dst_file, copy_metadata=True, follow_symlinks=False)
+        else:
+            extant_dirs.append(dst_dir)
+
+def make_tree(src, dst):
+    '''Build the source tree and the parts of it that already exist in dst.
+    Returns the number of source files'''
+    count = 0
+    data = b"x" * 512
+    for (top, games, subdirs, files, extant) in LAYOUT:
+        for game in range(games):
+            game_dir = os.path.join(src, top, "Game %d" % game)
+            for sub in range(subdirs):
+                path = os.path.join(game_dir, "replays", "r%d" % sub)
+                os.makedirs(path)
+                for i in range(files):
+                    with open(os.path.join(path, "file%d.dat" % i), "wb") as f:
+                        f.write(data)
+                count += files
+        if extant:
+            os.makedirs(os.path.join(dst, top))
+        #linked dirs are copied as links, point these at something that exists
+        #already so that try_copy can chmod through them
+        os.symlink(os.path.join(src, top, "Game 0"), os.path.join(src, top, "Current"))
+    with open(os.path.join(src, "desktop.ini"), "wb") as f:
+        f.write(data)
+    return count + 1
+
+def snapshot(path):
+    ret = set()
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            ret.add(os.path.relpath(os.path.join(root, name), path))
+    return ret
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    proton = load_proton(path)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        src = os.path.join(tmp, "src")
+        dst_template = os.path.join(tmp, "dst_template")
+        os.makedirs(dst_template)
+        files = make_tree(src, dst_template)
+        print(str(files) + " files in the source tree")
+
+        results = {}
+        for cache in ("cold", "warm") if os.getuid() == 0 else ("warm",):
+            for (name, fn) in (("old walker", lambda s, d: baseline_merge_user_dir(proton, s, d)),
+                               ("merge_user_dir", proton.merge_user_dir)):
+                dst = os.path.join(tmp, name.replace(" ", "_"))
+                if os.path.exists(dst):
+                    shutil.rmtree(dst)
+                shutil.copytree(dst_template, dst)
+                if cache == "cold":
+                    os.sync()
+                    with open("/proc/sys/vm/drop_caches", "w") as f:
+                        f.write("3")
+                start = time.perf_counter()
+                fn(src, dst)
+                print(name + ", " + cache + " cache: " + "%.2f" % (time.perf_counter() - start) + "s")
+                results[name] = snapshot(dst)
+
+        old = results["old walker"]
+        new = results["merge_user_dir"]
+        if old != new:
+            print("trees differ: " + str(len(old - new)) + " only from the old walker, " +
+                    str(len(new - old)) + " only from merge_user_dir")
+            for p in sorted(old ^ new)[:10]:
+                print("  " + p)
+            return 1
+        print(str(len(new)) + " entries in both destination trees")
+    finally:
+        shutil.rmtree(tmp)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
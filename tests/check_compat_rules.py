@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+#Golden check for COMPAT_RULES: compares the env and WINEDLLOVERRIDES that the
+#rule engine produces with the if-chains it replaced (init_env and
+#init_session before the rule table), over combinations of every flag the
+#rules look at, and times both. The env as prefix setup sees it has to match
+#as well.
+#
+#Usage: tests/check_compat_rules.py [path to proton]
+
+import itertools
+import os
+import random
+import sys
+import time
+
+from proton_loader import load_proton
+
+def baseline_env(env, dlloverrides, compat_config):
+    '''The compat flag handling of init_env before COMPAT_RULES'''
+    if "noesync" in compat_config:
+        env.pop("WINEESYNC", "")
+    else:
+        env["WINEESYNC"] = "1"
+
+    if not "noxim" in compat_config:
+        env.pop("WINE_ALLOW_XIM")
+
+    if "nofsync" in compat_config:
+        env.pop("WINEFSYNC", "")
+    else:
+        env["WINEFSYNC"] = "1"
+
+    if "nowritewatch" in compat_config:
+        env["WINE_DISABLE_WRITE_WATCH"] = "1"
+
+    if "oldglstr" in compat_config:
+        env["MESA_EXTENSION_MAX_YEAR"] = "2003"
+        env["__GL_ExtensionStringVersion"] = "17700"
+
+    if "forcelgadd" in compat_config:
+        env["WINE_LARGE_ADDRESS_AWARE"] = "1"
+    else:
+        if "noforcelgadd" in compat_config:
+            env["WINE_LARGE_ADDRESS_AWARE"] = "0"
+
+    if "heapdelayfree" in compat_config:
+        env["WINE_HEAP_DELAY_FREE"] = "1"
+
+    if "vkd3dbindlesstb" in compat_config:
+        append_to_env_str(env, "VKD3D_CONFIG", "force_bindless_texel_buffer", ",")
+
+    if "northstar" in compat_config:
+        append_to_env_str(env, "WINEDLLOVERRIDES", "wsock32=n,b", ";")
+    else:
+        append_to_env_str(env, "WINEDLLOVERRIDES", "midimap=n,b", ";")
+
+    if "vkd3dfl12" in compat_config:
+        if not "VKD3D_FEATURE_LEVEL" in env:
+            env["VKD3D_FEATURE_LEVEL"] = "12_0"
+
+    if "hidevggpu" in compat_config:
+        env["WINE_HIDE_VANGOGH_GPU"] = "1"
+
+    if "hidenvgpu" in compat_config and "enablenvapi" not in compat_config and "forcenvapi" not in compat_config:
+        env["WINE_HIDE_NVIDIA_GPU"] = "1"
+
+    if "usenativexinput13" in compat_config:
+        dlloverrides["xinput1_3"] = "n"
+
+    if "disablelibglesv2" in compat_config:
+        dlloverrides["libglesv2"] = "d"
+
+    if "nomfdxgiman" in compat_config:
+        env["WINE_DO_NOT_CREATE_DXGI_DEVICE_MANAGER"] = "1"
+
+    if "noopwr" in compat_config:
+        env["WINE_DISABLE_VULKAN_OPWR"] = "1"
+
+def baseline_dlls(env, dlloverrides, compat_config):
+    '''The compat flag handling of init_session after prefix setup, before COMPAT_RULES'''
+    if "nod3d12" in compat_config:
+        dlloverrides["d3d12"] = ""
+        if "dxgi" in dlloverrides:
+            del dlloverrides["dxgi"]
+
+    if "nod3d11" in compat_config:
+        dlloverrides["d3d11"] = ""
+        if "dxgi" in dlloverrides:
+            del dlloverrides["dxgi"]
+
+    if "nod3d10" in compat_config:
+        dlloverrides["d3d10_1"] = ""
+        dlloverrides["d3d10"] = ""
+        dlloverrides["dxgi"] = ""
+
+    if "nativevulkanloader" in compat_config:
+        dlloverrides["vulkan-1"] = "n"
+
+    if "nod3d9" in compat_config:
+        dlloverrides["d3d9"] = ""
+        dlloverrides["dxgi"] = ""
+
+    if "wined3d9" in compat_config:
+        dlloverrides["d3d9"] = "b"
+
+    if "enablenvapi" in compat_config or "forcenvapi" in compat_config:
+        env["DXVK_ENABLE_NVAPI"] = "1"
+
+    if "forcenvapi" in compat_config:
+        env["DXVK_NVAPI_ALLOW_OTHER_DRIVERS"] = "1"
+        env["DXVK_NVAPI_DRIVER_VERSION"] = "99999"
+        env["WINE_HIDE_AMD_GPU"] = "1"
+
+    if "enableamdags" in compat_config:
+        dlloverrides["amd_ags_x64"] = "b"
+
+def append_to_env_str(env, variable, append_str, separator):
+    if not variable in env:
+        env[variable] = append_str
+    else:
+        env[variable] = env[variable] + separator + append_str
+
+def finish(env, dlloverrides):
+    s = ";".join(dll + "=" + setting for dll, setting in dlloverrides.items())
+    append_to_env_str(env, "WINEDLLOVERRIDES", s, ";")
+    return env
+
+#what prefix setup may have put into the overrides, e.g. for DXVK and nvapi
+PREFIX_DLLS = [
+    {},
+    {"dxgi": "n", "d3d11": "n", "d3d10core": "n", "d3d9": "n"},
+    {"dxgi": "n", "d3d11": "n", "d3d12": "n", "nvapi64": "n", "nvapi": "n"},
+]
+
+BASE_ENVS = [
+    {"WINE_ALLOW_XIM": "0"},
+    {"WINE_ALLOW_XIM": "0", "WINEESYNC": "0", "WINEDLLOVERRIDES": "foo=n", "VKD3D_CONFIG": "dxr",
+        "VKD3D_FEATURE_LEVEL": "12_1", "WINE_LARGE_ADDRESS_AWARE": "1"},
+]
+
+INITIAL_DLLS = {"steam.exe": "b", "dotnetfx35.exe": "b", "beclient.dll": "b,n"}
+
+def run_baseline(base_env, prefix_dlls, compat_config):
+    env = dict(base_env)
+    dlloverrides = dict(INITIAL_DLLS)
+    baseline_env(env, dlloverrides, compat_config)
+    setup_env = dict(env)
+    dlloverrides.update(prefix_dlls)
+    baseline_dlls(env, dlloverrides, compat_config)
+    return (finish(env, dlloverrides), setup_env)
+
+def run_rules(proton, base_env, prefix_dlls, compat_config):
+    session = proton.Session.__new__(proton.Session)
+    session.env = dict(base_env)
+    session.dlloverrides = dict(INITIAL_DLLS)
+    session.compat_config = set(compat_config)
+    session.apply_compat_env_rules()
+    setup_env = dict(session.env)
+    session.dlloverrides.update(prefix_dlls)
+    session.apply_compat_dll_rules()
+    return (finish(session.env, session.dlloverrides), setup_env)
+
+def flag_combinations(flags):
+    '''Every combination of up to three flags, plus a fixed random sample of
+    larger ones'''
+    for n in range(4):
+        yield from itertools.combinations(flags, n)
+    rng = random.Random(0)
+    for _ in range(20000):
+        yield tuple(flag for flag in flags if rng.random() < 0.3)
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    proton = load_proton(path)
+
+    flags = sorted({ flag.lstrip("!") for rule in proton.COMPAT_RULES for cond in rule["if"] for flag in cond.split("|") })
+
+    cases = 0
+    failures = 0
+    for combo in flag_combinations(flags):
+        compat_config = set(combo)
+        for base_env in BASE_ENVS:
+            for prefix_dlls in PREFIX_DLLS:
+                cases += 1
+                old, old_setup = run_baseline(base_env, prefix_dlls, compat_config)
+                new, new_setup = run_rules(proton, base_env, prefix_dlls, compat_config)
+                if old != new or old_setup != new_setup:
+                    failures += 1
+                    if failures <= 10:
+                        print("MISMATCH flags=" + ",".join(sorted(compat_config)) + " env=" + str(base_env) + " prefix=" + str(prefix_dlls))
+                        for key in sorted(set(old) | set(new)):
+                            if old.get(key) != new.get(key):
+                                print("  " + key + ": " + str(old.get(key)) + " -> " + str(new.get(key)))
+
+    #like the old code, xim requires WINE_ALLOW_XIM, which init_env always sets
+    for name, fn in (("if-chains", lambda: run_baseline({}, {}, set())),
+                     ("COMPAT_RULES", lambda: run_rules(proton, {}, {}, set()))):
+        try:
+            fn()
+            print(name + ": xim without WINE_ALLOW_XIM doesn't raise KeyError")
+            failures += 1
+        except KeyError:
+            pass
+
+    #benchmark
+    compat_config = {"forcelgadd", "hidenvgpu", "enablenvapi", "nod3d12", "vkd3dfl12", "oldglstr"}
+    rounds = 20000
+    for name, fn in (("if-chains", lambda: run_baseline(BASE_ENVS[1], PREFIX_DLLS[1], compat_config)),
+                     ("COMPAT_RULES", lambda: run_rules(proton, BASE_ENVS[1], PREFIX_DLLS[1], compat_config))):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        print(name + ": " + "%.2f" % ((time.perf_counter() - start) / rounds * 1e6) + "us per session")
+
+    print(str(cases) + " cases, " + str(failures) + " failures")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
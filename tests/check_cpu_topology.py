@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+#Checks the cputopology:<policy> compat option against fake sysfs trees of a
+#few CPU layouts, and that a stale WINE_CPU_TOPOLOGY from a cached environment
+#doesn't survive a policy that can't be applied.
+#
+#Usage: tests/check_cpu_topology.py [path to proton]
+
+import os
+import shutil
+import sys
+import tempfile
+
+from proton_loader import load_proton
+
+def write(path, s):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(s + "\n")
+
+def make_tree(root, online, cpus, pmus={}, capacities={}):
+    '''cpus is a list of (cpu, core id, thread siblings, l3 shared CPU list, l3 size)'''
+    cpu_dir = root + "/devices/system/cpu/"
+    write(cpu_dir + "online", online)
+    for (cpu, core, siblings, l3, l3_size) in cpus:
+        d = cpu_dir + "cpu%d/" % cpu
+        write(d + "topology/physical_package_id", "0")
+        write(d + "topology/core_id", str(core))
+        write(d + "topology/thread_siblings_list", siblings)
+        caches = [(1, "Data", siblings, "48K"), (1, "Instruction", siblings, "32K"),
+                (2, "Unified", siblings, "1280K"), (3, "Unified", l3, l3_size)]
+        for i, (level, type_, shared, size) in enumerate(caches):
+            write(d + "cache/index%d/level" % i, str(level))
+            write(d + "cache/index%d/type" % i, type_)
+            write(d + "cache/index%d/shared_cpu_list" % i, shared)
+            write(d + "cache/index%d/size" % i, size)
+        if cpu in capacities:
+            write(d + "cpu_capacity", str(capacities[cpu]))
+    for pmu, cpu_list in pmus.items():
+        write(root + "/devices/" + pmu + "/cpus", cpu_list)
+
+def make_trees(tmp):
+    trees = {}
+
+    #hybrid intel, 8 P cores with SMT (0-15) and 8 E cores (16-23)
+    trees["hybrid"] = tmp + "/hybrid"
+    make_tree(trees["hybrid"], "0-23",
+            [(i, i // 2, "%d-%d" % (i - i % 2, i - i % 2 + 1), "0-23", "30720K") for i in range(16)] +
+            [(i, 40 + i, str(i), "0-23", "30720K") for i in range(16, 24)],
+            pmus={"cpu_core": "0-15", "cpu_atom": "16-23"})
+
+    #two CCDs, only the first one with stacked cache, siblings n and n+16
+    trees["x3d"] = tmp + "/x3d"
+    make_tree(trees["x3d"], "0-31",
+            [(i, i % 16, "%d,%d" % (i % 16, i % 16 + 16),
+                "0-7,16-23" if i % 16 < 8 else "8-15,24-31",
+                "98304K" if i % 16 < 8 else "32768K") for i in range(32)])
+
+    #big.LITTLE, no PMUs per core type but different capacities
+    trees["biglittle"] = tmp + "/biglittle"
+    make_tree(trees["biglittle"], "0-7",
+            [(i, i, str(i), "0-7", "4096K") for i in range(8)],
+            capacities={i: 446 if i < 4 else 1024 for i in range(8)})
+
+    #4 cores with SMT, siblings n and n+4, with 6 and 7 taken offline
+    trees["offline"] = tmp + "/offline"
+    make_tree(trees["offline"], "0-5",
+            [(i, i % 4, "%d,%d" % (i % 4, i % 4 + 4), "0-7", "8192K") for i in range(8)])
+
+    return trees
+
+#(tree, policy, expected WINE_CPU_TOPOLOGY)
+CASES = [
+    ("hybrid", "pcores", "16:" + ",".join(str(i) for i in range(16))),
+    ("hybrid", "pcores+nosmt", "8:0,2,4,6,8,10,12,14"),
+    ("hybrid", "max4", "4:0,2,4,6"),
+    ("hybrid", "cache", "24:" + ",".join(str(i) for i in range(24))),
+    ("x3d", "pcores", "32:" + ",".join("%d,%d" % (i, i + 16) for i in range(16))),
+    ("x3d", "cache", "16:" + ",".join("%d,%d" % (i, i + 16) for i in range(8))),
+    ("x3d", "cache+nosmt", "8:0,1,2,3,4,5,6,7"),
+    ("x3d", "nosmt+max6", "6:0,1,2,3,4,5"),
+    ("biglittle", "pcores", "4:4,5,6,7"),
+    ("biglittle", "nosmt", "8:0,1,2,3,4,5,6,7"),
+    ("offline", "nosmt", "4:0,1,2,3"),
+    ("offline", "max5", "5:0,4,1,2,3"),
+]
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    proton = load_proton(path)
+
+    failures = 0
+    tmp = tempfile.mkdtemp()
+    try:
+        trees = make_trees(tmp)
+        for (tree, policy, expected) in CASES:
+            cpus = proton.select_cpus(proton.read_cpu_topology(trees[tree]), policy)
+            got = proton.cpu_topology_str(cpus)
+            if got != expected:
+                print("FAIL " + tree + " " + policy + ": " + got + ", expected " + expected)
+                failures += 1
+            else:
+                print("ok   " + tree + " " + policy + ": " + got + " (" + proton.describe_cpus(cpus) + ")")
+
+        #the cache is dropped when the key, the online CPU list, changes
+        os.environ["XDG_RUNTIME_DIR"] = tmp
+        os.chmod(tmp, 0o700)
+        probes = []
+        def probe():
+            probes.append(1)
+            return len(probes)
+        values = [proton.boot_cached("cpu_topology_check", probe, key=key) for key in ("0-7", "0-7", "0-5")]
+        if proton.boot_id() is not None and values != [1, 1, 2]:
+            print("FAIL boot_cached keyed by online CPUs returned " + str(values) + ", expected [1, 1, 2]")
+            failures += 1
+
+        #an unusable policy removes a WINE_CPU_TOPOLOGY left in a cached env
+        os.environ.pop("WINE_CPU_TOPOLOGY", None)
+        session = proton.Session.__new__(proton.Session)
+        session.env = {"WINE_CPU_TOPOLOGY": "2:0,1"}
+        session.compat_config = {"cputopology:bogus"}
+        session.setup_cpu_topology({})
+        if "WINE_CPU_TOPOLOGY" in session.env:
+            print("FAIL stale WINE_CPU_TOPOLOGY kept with an unusable policy")
+            failures += 1
+    finally:
+        shutil.rmtree(tmp)
+
+    print(str(len(CASES) + 2) + " checks, " + str(failures) + " failures")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
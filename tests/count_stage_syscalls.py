@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+#Counts the syscalls try_copy() and stage_file() make per staged DLL, for a
+#fresh prefix and for the usual relaunch where every file is already there.
+#
+#Counting is done by wrapping the os/fcntl functions proton calls, so each
+#wrapper call is one syscall. io.open() is counted as open+fstat+close, which
+#is what it does for an unbuffered binary file.
+#
+#Usage: tests/count_stage_syscalls.py [path to proton]
+
+import builtins
+import collections
+import fcntl
+import os
+import shutil
+import sys
+import tempfile
+
+from proton_loader import load_proton
+
+DLLS = 40
+
+OS_CALLS = ["stat", "lstat", "fstat", "open", "close", "chmod", "fchmod", "unlink", "remove",
+        "symlink", "readlink", "scandir", "sendfile", "read", "write", "mkdir", "utime"]
+
+class Counter:
+    def __init__(self, proton):
+        self.proton = proton
+        self.counts = collections.Counter()
+        self.saved = []
+
+    def wrap(self, obj, name, counted=None):
+        orig = getattr(obj, name)
+        names = counted or [name]
+        def wrapper(*args, **kwargs):
+            for n in names:
+                self.counts[n] += 1
+            return orig(*args, **kwargs)
+        self.saved.append((obj, name, orig))
+        setattr(obj, name, wrapper)
+
+    def __enter__(self):
+        for name in OS_CALLS:
+            self.wrap(os, name)
+        self.wrap(fcntl, "ioctl")
+        self.wrap(builtins, "open", ["open", "fstat", "close"])
+        if self.proton.copy_file_range is not None:
+            self.wrap(self.proton, "copy_file_range")
+        self.counts.clear()
+        return self
+
+    def __exit__(self, *args):
+        for (obj, name, orig) in reversed(self.saved):
+            setattr(obj, name, orig)
+        self.saved = []
+
+def make_sources(src_dir):
+    files = []
+    for i in range(DLLS):
+        path = os.path.join(src_dir, "lib%02d.dll" % i)
+        with open(path, "wb") as f:
+            f.write(os.urandom(64 * 1024))
+        os.chmod(path, 0o644)
+        #like the wine dlls, only some have debug info next to them
+        if i % 2 == 0:
+            with open(path + ".debug", "wb") as f:
+                f.write(b"debug")
+        files.append((path, "drive_c/windows/system32/" + os.path.basename(path), False))
+    return files
+
+def run_try_copy(proton, prefix, files, tracked):
+    with open(tracked, "a") as track_file:
+        for (src, dst, optional) in files:
+            proton.try_copy(src, dst, optional=optional,
+                    prefix=prefix, track_file=track_file, link_debug=True)
+
+def run_stage_file(proton, prefix, files, tracked):
+    with open(tracked, "a") as track_file, proton.DirCache() as dirs:
+        for (src, dst, optional) in files:
+            proton.stage_file(src, prefix + dst, dirs, prefix, track_file, optional=optional)
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    proton = load_proton(path)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        src_dir = os.path.join(tmp, "src")
+        os.mkdir(src_dir)
+        files = make_sources(src_dir)
+
+        results = {}
+        for (name, fn) in (("try_copy", run_try_copy), ("stage_file", run_stage_file)):
+            prefix = os.path.join(tmp, name) + "/"
+            os.makedirs(prefix + "drive_c/windows/system32")
+            tracked = os.path.join(tmp, name + ".tracked")
+            for run in ("fresh", "relaunch"):
+                with Counter(proton) as counter:
+                    fn(proton, prefix, files, tracked)
+                results[(name, run)] = counter.counts
+
+        for run in ("fresh", "relaunch"):
+            print(run + " prefix, per staged DLL:")
+            calls = sorted(set(results[("try_copy", run)]) | set(results[("stage_file", run)]))
+            print("  %-16s %10s %10s" % ("", "try_copy", "stage_file"))
+            for call in calls + ["total"]:
+                if call == "total":
+                    old = sum(results[("try_copy", run)].values())
+                    new = sum(results[("stage_file", run)].values())
+                else:
+                    old = results[("try_copy", run)][call]
+                    new = results[("stage_file", run)][call]
+                print("  %-16s %10.2f %10.2f" % (call, old / DLLS, new / DLLS))
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    sys.exit(main())
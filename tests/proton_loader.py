@@ -0,0 +1,27 @@
+#Loads the proton script as a module for the checks and benchmarks in this
+#directory. It has no .py suffix, so it needs an explicit loader.
+
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+def default_path():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "proton")
+
+def load_proton(path=None):
+    '''Import proton from path, the one next to this directory by default,
+    without running its __main__ block'''
+    if path is None:
+        path = default_path()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    loader = importlib.machinery.SourceFileLoader("proton", path)
+    spec = importlib.util.spec_from_loader("proton", loader)
+    module = importlib.util.module_from_spec(spec)
+    saved_argv = sys.argv
+    sys.argv = [path]
+    try:
+        loader.exec_module(module)
+    finally:
+        sys.argv = saved_argv
+    return module
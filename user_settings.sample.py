@@ -9,6 +9,11 @@ user_settings = {
     #enable logging
     "PROTON_LOG": "1",
 
+    #write the log through a pipe and compress it in the background (gzip or zstd),
+    #so slow disks don't stall the game; stops after PROTON_LOG_MAX_MB of uncompressed log
+#    "PROTON_LOG_COMPRESS": "1",
+#    "PROTON_LOG_MAX_MB": "4096",
+
     #custom Wine debug logging
     #"WINEDEBUG": "+timestamp,+pid,+tid,+seh,+unwind,+threadname,+debugstr,+loaddll,+mscoree",
 
@@ -45,4 +50,12 @@ user_settings = {
 
     #Disable futex-based in-process synchronization primitives
 #    "PROTON_NO_FSYNC": "1",
+
+    #Limit the CPUs the game sees, e.g. to the performance cores without SMT siblings.
+    #Steps: pcores, cache (largest last level cache), nosmt, max<N>; joined with "+"
+#    "PROTON_CPU_TOPOLOGY": "pcores+nosmt",
+
+    #Pick the GPU to render on: discrete (default), integrated, vendor:<nvidia|amd|intel>,
+    #name:<Vulkan device name>, or 0 to leave GPU selection alone. See docs/PRIME.md
+#    "PROTON_GPU": "vendor:amd",
 }